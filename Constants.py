@@ -18,7 +18,45 @@ DIRECTION = {
 	"RIGHT"	: [1, 0]
 }
 
-CMD_LIST = ["B", "E", "T", "S", "J", "I", "X", "P", "D", "V", "C", "R", "H", "A", "Q"]
+INTERLOCKING_TYPES = ["Begin", "End", "Signal"]
+
+FRAME_DELAY = 1
+TILE_SIZE = 32
+
+SIGNAL_DWELL = 3
+SIM_ROUTE_LENGTH = 200
+SIM_WINDOW = 8
+HANDOFF_BATCH = 512
+
+TRACE_MAGIC = b"TSTR"
+TRACE_END = b"TEND"
+TRACE_VERSION = 1
+TRACE_RECORD = "<BIIHHB"
+TRACE_KEYFRAME_INTERVAL = 256
+TRACE_READ_RECORDS = 4096
+
+OPTIMISER_PARALLEL_JUNCTIONS = 12
+OPTIMISER_TASKS_PER_WORKER = 4
+
+EVENT_MESSAGES = {
+	"map_created"		: "System Map Created - Size {size} x {size}\nOrigin (0, 0) is at the TOP LEFT corner - All values are positive\n",
+	"map_cleared"		: "System Map Reset - Size {size} x {size}\nOrigin (0, 0) is at the TOP LEFT corner - All values are positive\n",
+	"map_drawn"			: "{text}",
+	"object_placed"		: "{name} object added to map ({x}, {y})\n",
+	"object_removed"	: "Map object removed at ({x}, {y}) - coordinate is now 'None'\n",
+	"validation_error"	: "{message}",
+	"preset_loaded"		: "Preset map loaded to system !!!\n",
+	"train_departed"	: "!!! Train is leaving the station !!!",
+	"train_waiting"		: "!!! Train stopping to wait for track action !!!\nAction: {action}",
+	"train_moved"		: None,
+	"train_arrived"		: "!!! Train has arrived !!!"
+}
+
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8642
+SERVICE_LATENCY_WINDOW = 10000
+
+CMD_LIST = ["B", "E", "T", "S", "J", "I", "X", "P", "D", "V", "C", "R", "O", "H", "A", "Q"]
 
 CMD_STR = """
 B - Place [B]eginningPoint object on map grid
@@ -50,6 +88,8 @@ C - [C]lear map back to empty configuration
 
 R - [R]un train on map to start simulation
 
+O - [O]ptimise junction settings for the shortest route
+
 H - [H]elp function to list all available commands
 
 A - [A]bout the author
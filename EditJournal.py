@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+"""Class to journal SystemMap edits with undo, redo and named branches of layout versions
+
+Every complete edit on the map becomes a version holding only the cells it changed, each as
+(x, y, old, new) object specs, plus the BeginningPoint and EndPoint positions after the edit.
+Versions form a tree that is only ever appended to. Branches are named pointers into the tree,
+and a checkout undoes and redoes only the versions between the current head and the target.
+
+A journal saved to disk is a compact change log of JSON lines: a header with the base layout,
+one line per version and a final line with the branch pointers. Loading it onto an empty map
+applies the base layout and then only the versions leading to the checked out branch.
+"""
+
+import json
+from SystemClasses import BeginningPoint, EndPoint, TrackSegment, Signal, Junction
+
+
+def object_to_spec(obj):
+	"""Convert a TrackObject (or None) into a compact list spec, e.g. ["S", "RED"]"""
+	if obj is None:
+		return None
+	obj_type = obj.get_type()
+	if obj_type == "Begin":
+		return ["B"]
+	if obj_type == "End":
+		return ["E"]
+	if obj_type == "TrackSegment":
+		return ["T"]
+	if obj_type == "Signal":
+		return ["S", obj.get_state()]
+	if obj_type == "Junction":
+		return ["J", obj.get_direction()]
+	raise ValueError("TrackObject type {} cannot be journaled".format(obj_type))
+
+
+def spec_to_object(x, y, spec):
+	"""Build the TrackObject (or None) described by a spec at location (x, y)"""
+	if spec is None:
+		return None
+	if spec[0] == "B":
+		return BeginningPoint(x, y)
+	if spec[0] == "E":
+		return EndPoint(x, y)
+	if spec[0] == "T":
+		return TrackSegment(x, y)
+	if spec[0] == "S":
+		return Signal(x, y, spec[1])
+	if spec[0] == "J":
+		return Junction(x, y, spec[1])
+	raise ValueError("Unknown journal spec {}".format(spec))
+
+
+class EditJournal(object):
+	"""Append-only journal of edits on a SystemMap with undo, redo and branch checkouts"""
+	def __init__(self, system_map, branch="main"):
+		self.__map = system_map
+		self.__pending = list()
+		self.__replaying = False
+		self.__redo = list()
+		self.__base = list()
+
+		grid = system_map.get_map()
+		for x in range(system_map.get_size()):
+			for y in range(system_map.get_size()):
+				if grid[x][y] is not None:
+					self.__base.append([x, y, object_to_spec(grid[x][y])])
+
+		# Version records: [parent, depth, changes, begin, end]
+		self.__versions = [[None, 0, [], list(system_map.get_begin()), list(system_map.get_end())]]
+		self.__branches = {branch: 0}
+		self.__branch = branch
+		system_map.add_observer(self)
+
+	def get_branch(self):
+		return self.__branch
+
+	def get_branches(self):
+		return dict(self.__branches)
+
+	def get_head(self):
+		return self.__branches[self.__branch]
+
+	def get_version_count(self):
+		return len(self.__versions)
+
+	def get_history(self):
+		"""Return list of version ids from the base layout to the current head"""
+		history = list()
+		version = self.get_head()
+		while version is not None:
+			history.append(version)
+			version = self.__versions[version][0]
+		return history[::-1]
+
+	def cell_changed(self, x, y, old, new):
+		"""SystemMap observer hook - buffer the cell change until the edit is complete"""
+		if not self.__replaying:
+			self.__pending.append([x, y, object_to_spec(old), object_to_spec(new)])
+
+	def edit_done(self):
+		"""SystemMap observer hook - record buffered cell changes as a new version on the branch"""
+		if self.__replaying or not self.__pending:
+			return
+		head = self.get_head()
+		depth = self.__versions[head][1] + 1
+		begin = list(self.__map.get_begin())
+		end = list(self.__map.get_end())
+		self.__versions.append([head, depth, self.__pending, begin, end])
+		self.__branches[self.__branch] = len(self.__versions) - 1
+		self.__pending = list()
+		self.__redo = list()
+
+	def undo(self):
+		"""Revert the last version on the current branch - returns False at the base layout"""
+		head = self.get_head()
+		parent = self.__versions[head][0]
+		if parent is None:
+			return False
+		self.__revert(head)
+		self.__branches[self.__branch] = parent
+		self.__redo.append(head)
+		return True
+
+	def redo(self):
+		"""Re-apply the last undone version - returns False when there is nothing to redo"""
+		if not self.__redo:
+			return False
+		version = self.__redo.pop()
+		self.__apply(version)
+		self.__branches[self.__branch] = version
+		return True
+
+	def create_branch(self, name):
+		"""Create a new branch pointing at the current head without switching to it"""
+		if name in self.__branches:
+			raise ValueError("Branch {} already exists".format(name))
+		self.__branches[name] = self.get_head()
+
+	def checkout(self, name):
+		"""Switch to a branch, replaying only the versions between the current head and its tip"""
+		if name not in self.__branches:
+			raise ValueError("Branch {} does not exist".format(name))
+		source = self.get_head()
+		target = self.__branches[name]
+
+		backward = list()
+		forward = list()
+		while source != target:
+			if self.__versions[source][1] >= self.__versions[target][1]:
+				backward.append(source)
+				source = self.__versions[source][0]
+			else:
+				forward.append(target)
+				target = self.__versions[target][0]
+
+		for version in backward:
+			self.__revert(version)
+		for version in reversed(forward):
+			self.__apply(version)
+
+		self.__branch = name
+		self.__redo = list()
+
+	def save(self, path):
+		"""Write the base layout, every version and the branch pointers as a JSON lines change log"""
+		with open(path, "w") as f:
+			header = {
+				"size": self.__map.get_size(),
+				"base": self.__base,
+				"begin": self.__versions[0][3],
+				"end": self.__versions[0][4]
+			}
+			f.write(json.dumps(header, separators=(",", ":")) + "\n")
+			for version in self.__versions[1:]:
+				f.write(json.dumps(version, separators=(",", ":")) + "\n")
+			f.write(json.dumps({"branches": self.__branches, "branch": self.__branch}, separators=(",", ":")) + "\n")
+
+	def load(self, path):
+		"""Restore a saved change log onto the still empty map and check out its saved branch"""
+		with open(path, "r") as f:
+			lines = [json.loads(line) for line in f if line.strip()]
+
+		header = lines[0]
+		footer = lines[-1]
+		if header["size"] != self.__map.get_size():
+			raise ValueError("Journal map size {} does not match SystemMap size {}".format(header["size"], self.__map.get_size()))
+		if self.__base or len(self.__versions) > 1:
+			raise ValueError("Change log can only be loaded onto an empty map with an empty journal")
+
+		self.__replaying = True
+		try:
+			for x, y, spec in header["base"]:
+				self.__map.restore_cell(x, y, spec_to_object(x, y, spec))
+		finally:
+			self.__replaying = False
+
+		self.__base = header["base"]
+		self.__versions = [[None, 0, [], header["begin"], header["end"]]] + lines[1:-1]
+		self.__branches = dict(footer["branches"])
+		self.__branch = footer["branch"]
+		self.__redo = list()
+
+		forward = list()
+		version = self.get_head()
+		while version != 0:
+			forward.append(version)
+			version = self.__versions[version][0]
+		if not forward:
+			self.__map.set_begin(header["begin"])
+			self.__map.set_end(header["end"])
+		for version in reversed(forward):
+			self.__apply(version)
+
+	def __revert(self, version):
+		"""Undo the cell changes of a version and restore the begin and end of its parent"""
+		parent = self.__versions[self.__versions[version][0]]
+		self.__replaying = True
+		try:
+			for x, y, old, new in reversed(self.__versions[version][2]):
+				self.__map.restore_cell(x, y, spec_to_object(x, y, old))
+		finally:
+			self.__replaying = False
+		self.__map.set_begin(parent[3])
+		self.__map.set_end(parent[4])
+
+	def __apply(self, version):
+		"""Redo the cell changes of a version and restore its begin and end"""
+		record = self.__versions[version]
+		self.__replaying = True
+		try:
+			for x, y, old, new in record[2]:
+				self.__map.restore_cell(x, y, spec_to_object(x, y, new))
+		finally:
+			self.__replaying = False
+		self.__map.set_begin(record[3])
+		self.__map.set_end(record[4])
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+"""Create pluggable sinks for structured events emitted by the Train Signaling System engine
+
+Every event is a kind string (see Constants.EVENT_MESSAGES) and a dictionary of data. The
+engine asks a sink whether it accepts a kind before building the event, so a NullSink makes
+library calls quiet and skips work such as rendering the map.
+
+Class list:
+- EventSink (BaseClass)
+- NullSink
+- ConsoleSink
+- BufferedSink
+- CallbackSink
+"""
+
+import Constants
+
+
+def format_event(kind, data):
+	"""Return the console text for an event, or None when the event has no console output"""
+	if kind == "object_inspected":
+		obj = data["object"]
+		if obj is None:
+			return "No Track Object (None) is present at coordinates ({}, {})\n".format(data["x"], data["y"])
+		obj_type = obj["type"]
+		lines = list()
+		lines.append("TrackObject Type: {}".format(obj_type))
+		lines.append("{} Designator: {}".format(obj_type, obj["designator"]))
+		lines.append("{} X Location: {}".format(obj_type, obj["x"]))
+		lines.append("{} Y Location: {}".format(obj_type, obj["y"]))
+		if "state" in obj:
+			lines.append("{} State: {}".format(obj_type, obj["state"]))
+		if "direction" in obj:
+			lines.append("{} Direction: {}".format(obj_type, obj["direction"]))
+		if "moving" in obj:
+			lines.append("{} Moving: {}".format(obj_type, obj["moving"]))
+		lines.append("\n")
+		return "\n".join(lines)
+
+	template = Constants.EVENT_MESSAGES.get(kind)
+	if template is None:
+		return None
+	return template.format(**data)
+
+
+class EventSink(object):
+	"""Base class for any object receiving structured events from the engine"""
+	def accepts(self, kind):
+		return True
+
+	def emit(self, kind, data):
+		pass
+
+
+class NullSink(EventSink):
+	"""Sink discarding every event, so the engine skips building them at all"""
+	def accepts(self, kind):
+		return False
+
+
+class ConsoleSink(EventSink):
+	"""Sink printing events to the console as the interactive Train Signal System shows them"""
+	def emit(self, kind, data):
+		text = format_event(kind, data)
+		if text is not None:
+			print(text)
+
+
+class BufferedSink(EventSink):
+	"""Sink keeping a log of (kind, data) events, optionally limited to a set of kinds"""
+	def __init__(self, kinds=None):
+		self.__kinds = None if kinds is None else set(kinds)
+		self.__events = list()
+
+	def get_events(self):
+		return list(self.__events)
+
+	def get_messages(self):
+		"""Return the console text of every buffered event that has any"""
+		messages = list()
+		for kind, data in self.__events:
+			text = format_event(kind, data)
+			if text is not None:
+				messages.append(text)
+		return messages
+
+	def clear(self):
+		self.__events = list()
+
+	def accepts(self, kind):
+		return self.__kinds is None or kind in self.__kinds
+
+	def emit(self, kind, data):
+		self.__events.append((kind, data))
+
+
+class CallbackSink(EventSink):
+	"""Sink forwarding every event to a callback(kind, data) function"""
+	def __init__(self, callback, kinds=None):
+		self.__callback = callback
+		self.__kinds = None if kinds is None else set(kinds)
+
+	def accepts(self, kind):
+		return self.__kinds is None or kind in self.__kinds
+
+	def emit(self, kind, data):
+		self.__callback(kind, data)
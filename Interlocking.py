@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+"""Class to precompute and maintain the interlocking table of a Train Signaling System map
+
+A route runs from one signal, BeginningPoint or EndPoint to the next one reachable along the
+track without passing through another, leaving each Junction in its current direction as
+map_bfs does. Every map cell is a block numbered x * size + y, and the
+blocks claimed by a route are stored as an integer bitset, so two routes conflict when the
+AND of their bitsets is non-zero.
+"""
+
+import Constants
+from collections import deque
+
+
+class Interlocking(object):
+	"""Interlocking table of all routes on a SystemMap, rebuilt only for routes touched by edits"""
+	def __init__(self, system_map):
+		self.__map = system_map
+		self.__size = system_map.get_size()
+		self.__routes = dict()
+		self.__sources = dict()
+		self.__dirty = set()
+		self.__built = False
+		system_map.add_observer(self)
+
+	def get_size(self):
+		return self.__size
+
+	def get_routes(self):
+		"""Return list of (source, destination) route keys in the table"""
+		self.update()
+		return sorted(self.__routes.keys())
+
+	def get_route_bits(self, source, dest):
+		"""Return the bitset of blocks claimed by the route from source to destination"""
+		self.update()
+		key = (tuple(source), tuple(dest))
+		if key not in self.__routes:
+			raise KeyError("No route in interlocking table from {} to {}".format(list(source), list(dest)))
+		return self.__routes[key]
+
+	def get_route_blocks(self, source, dest):
+		"""Return list of [x, y] blocks claimed by the route from source to destination"""
+		return self.bits_to_blocks(self.get_route_bits(source, dest))
+
+	def block_bit(self, x, y):
+		"""Return the single-block bitset for location (x, y)"""
+		return 1 << (x * self.__size + y)
+
+	def bits_to_blocks(self, bits):
+		"""Decode a block bitset into a list of [x, y] coordinates"""
+		blocks = list()
+		while bits:
+			low = bits & -bits
+			index = low.bit_length() - 1
+			blocks.append([index // self.__size, index % self.__size])
+			bits ^= low
+		return blocks
+
+	def routes_conflict(self, route_a, route_b):
+		"""Check whether two (source, destination) routes claim any common block"""
+		bits_a = self.get_route_bits(route_a[0], route_a[1])
+		bits_b = self.get_route_bits(route_b[0], route_b[1])
+		return (bits_a & bits_b) != 0
+
+	def get_conflicts(self, source, dest):
+		"""Return list of route keys sharing at least one block with the given route"""
+		bits = self.get_route_bits(source, dest)
+		key = (tuple(source), tuple(dest))
+		return sorted(k for k, v in self.__routes.items() if k != key and v & bits)
+
+	def cell_changed(self, x, y, old, new):
+		"""SystemMap observer hook - mark location (x, y) for the next table update"""
+		self.__dirty.add((x, y))
+
+	def update(self):
+		"""Recompute routes for every source whose search touched an edited location"""
+		if not self.__built:
+			self.__dirty.clear()
+			self.__routes.clear()
+			self.__sources.clear()
+			grid = self.__map.get_map()
+			for x in range(self.__size):
+				for y in range(self.__size):
+					if grid[x][y] is not None and grid[x][y].get_type() in Constants.INTERLOCKING_TYPES:
+						self.__build_source((x, y))
+			self.__built = True
+			return
+
+		if not self.__dirty:
+			return
+
+		mask = 0
+		for x, y in self.__dirty:
+			mask |= self.block_bit(x, y)
+
+		affected = set(s for s, (explored, dests) in self.__sources.items() if explored & mask)
+		affected.update(self.__dirty)
+		self.__dirty.clear()
+
+		grid = self.__map.get_map()
+		for source in affected:
+			if source in self.__sources:
+				for dest in self.__sources.pop(source)[1]:
+					del self.__routes[(source, dest)]
+			obj = grid[source[0]][source[1]]
+			if obj is not None and obj.get_type() in Constants.INTERLOCKING_TYPES:
+				self.__build_source(source)
+
+	def __build_source(self, source):
+		"""Breadth first search from a source to every neighbouring signal or end point"""
+		grid = self.__map.get_map()
+		explored = self.block_bit(source[0], source[1])
+		parent = {source: None}
+		dests = list()
+		q = deque([source])
+
+		while q:
+			node = q.popleft()
+			for move in self.__moves(grid, node):
+				nxt = (node[0] + move[0], node[1] + move[1])
+				if not self.__map.check_valid_coords(nxt[0], nxt[1]):
+					continue
+				explored |= self.block_bit(nxt[0], nxt[1])
+				if nxt in parent:
+					continue
+				obj = grid[nxt[0]][nxt[1]]
+				if obj is None:
+					continue
+				parent[nxt] = node
+				if obj.get_type() in Constants.INTERLOCKING_TYPES:
+					dests.append(nxt)
+				else:
+					q.append(nxt)
+
+		for dest in dests:
+			bits = 0
+			node = dest
+			while node != source:
+				bits |= self.block_bit(node[0], node[1])
+				node = parent[node]
+			self.__routes[(source, dest)] = bits
+
+		self.__sources[source] = (explored, dests)
+
+	def __moves(self, grid, node):
+		"""Return the moves out of node - only the set direction for a Junction pointing at track"""
+		obj = grid[node[0]][node[1]]
+		if obj is not None and obj.get_type() == "Junction":
+			move = Constants.DIRECTION[obj.get_direction()]
+			x, y = node[0] + move[0], node[1] + move[1]
+			if self.__map.check_valid_coords(x, y) and grid[x][y] is not None:
+				return [move]
+		return Constants.DIRECTION.values()
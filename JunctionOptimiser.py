@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+
+"""Class to search Junction settings giving the shortest routes on a Train Signaling System map"""
+
+import heapq
+import Constants
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+class JunctionConfiguration(object):
+	"""Result of a junction optimisation - settings, released signals and the routes they give"""
+	def __init__(self, cost, junctions, released, paths):
+		self.__cost = cost
+		self.__junctions = junctions
+		self.__released = released
+		self.__paths = paths
+
+	def get_cost(self):
+		return self.__cost
+
+	def get_junctions(self):
+		"""Return dictionary of Junction (x, y) to the direction it must be set to"""
+		return dict(self.__junctions)
+
+	def get_released(self):
+		"""Return list of RED signal (x, y) locations the routes release"""
+		return list(self.__released)
+
+	def get_paths(self):
+		return [list(path) for path in self.__paths]
+
+
+_shared_bound = None
+
+
+def _init_worker(shared_bound):
+	"""Worker process initialiser - keep the bound shared by every worker's search"""
+	global _shared_bound
+	_shared_bound = shared_bound
+
+
+def _solve_subtree(snapshot, release_signals, routes, fixed):
+	"""Worker process task - run the branch and bound search below one set of fixed settings"""
+	return JunctionOptimiser(snapshot, release_signals).solve(routes, fixed, shared_bound=_shared_bound)
+
+
+class JunctionOptimiser(object):
+	"""Search for Junction settings (and RED signal releases) minimising route lengths on a MapSnapshot"""
+	def __init__(self, snapshot, release_signals=True, workers=1):
+		self.__snapshot = snapshot
+		self.__release = release_signals
+		self.__workers = workers
+		self.__memo = dict()
+		self.__distances = dict()
+		self.__junctions = list()
+		self.__junction_cells = set()
+		self.__red = set()
+		self.__moves = dict()
+		self.__entering = dict()
+
+		size = snapshot.get_size()
+		for x in range(size):
+			for y in range(size):
+				obj = snapshot.get_object(x, y)
+				if obj is None:
+					continue
+				self.__moves[(x, y)] = snapshot.get_neighbours(x, y)
+				for direction, pos in self.__moves[(x, y)]:
+					self.__entering.setdefault(pos, list()).append((x, y))
+				if obj.get_type() == "Junction":
+					self.__junctions.append((x, y))
+					self.__junction_cells.add((x, y))
+				elif obj.get_type() == "Signal" and obj.get_state() == "RED":
+					self.__red.add((x, y))
+
+	def get_junctions(self):
+		return list(self.__junctions)
+
+	def get_options(self, x, y):
+		"""Return the valid direction settings for the Junction at (x, y) - those holding track"""
+		return [direction for direction, pos in self.__moves.get((x, y), [])]
+
+	def optimise(self, routes=None):
+		"""Return the JunctionConfiguration giving the shortest total length over (begin, end) routes
+
+		Routes default to the single route from the map's BeginningPoint to its EndPoint.
+		Returns None when no setting of the junctions lets every route through.
+		"""
+		if routes is None:
+			routes = [(self.__snapshot.get_begin(), self.__snapshot.get_end())]
+		routes = [(tuple(begin), tuple(end)) for begin, end in routes]
+
+		for i in range(len(routes)):
+			for j in range(i + 1, len(routes)):
+				if self.solve([routes[i], routes[j]]) is None:
+					return None
+
+		if self.__workers > 1 and len(self.__junctions) >= Constants.OPTIMISER_PARALLEL_JUNCTIONS:
+			best = self.__solve_parallel(routes)
+		else:
+			best = self.solve(routes)
+
+		if best is None:
+			return None
+		cost, settings, results = best
+		released = sorted(set(pos for result in results for pos in result[3]))
+		return JunctionConfiguration(cost, dict(settings), released, [result[1] for result in results])
+
+	def solve(self, routes, fixed=None, bound=None, shared_bound=None):
+		"""Best first branch and bound over conflicting junctions below the fixed settings
+
+		Search nodes are taken cheapest lower bound first, so the first one without conflicts
+		is optimal. A multiprocessing Value given as shared_bound holds the best cost found by
+		any worker, and is read as a bound and lowered when this search finds better. Returns
+		(cost, settings, route results) for the best configuration costing less than bound, or
+		None when there is none.
+		"""
+		fixed = dict() if fixed is None else dict(fixed)
+		results = list()
+		for begin, end in routes:
+			result = self.search_route(begin, end, fixed)
+			if result is None:
+				return None
+			results.append(result)
+
+		best = None
+		for i in range(len(routes)):
+			greedy = self.__greedy(routes, fixed, i)
+			if greedy is not None and (bound is None or greedy[0] < bound):
+				best = greedy
+				bound = greedy[0]
+
+		count = 0
+		heap = [(sum(result[0] for result in results), 0, count, fixed, results)]
+		while heap:
+			lower, depth, c, fixed, results = heapq.heappop(heap)
+			if shared_bound is not None and (bound is None or shared_bound.value < bound):
+				bound = shared_bound.value
+			if bound is not None and lower >= bound:
+				break
+			conflict, children, extra = self.__expand(routes, fixed, results)
+			if conflict is None:
+				if shared_bound is not None:
+					with shared_bound.get_lock():
+						shared_bound.value = min(shared_bound.value, lower)
+				return lower, children, results
+			cost = sum(result[0] for result in results)
+			if cost + extra > lower:
+				count += 1
+				heapq.heappush(heap, (cost + extra, depth, count, fixed, results))
+				continue
+			for child_cost, child, child_results in children:
+				child_lower = max(child_cost, lower)
+				if bound is None or child_lower < bound:
+					count += 1
+					heapq.heappush(heap, (child_lower, depth - 1, count, child, child_results))
+		return best
+
+	def search_route(self, begin, end, fixed):
+		"""A* search for the shortest route from begin to end respecting fixed junction settings
+
+		Junctions that are not fixed may be left in any direction holding track, which makes the
+		search a relaxation whose cost is a lower bound. Leaving a RED signal, the first cell
+		included, costs one extra move for the signal change, as in MapSnapshot.plan_route.
+		Returns (cost, path, visits, released) or None when there is no route, where visits
+		lists the (junction, direction) exits taken.
+		"""
+		begin = tuple(begin)
+		end = tuple(end)
+		key = (begin, end, frozenset(fixed.items()))
+		if key in self.__memo:
+			return self.__memo[key]
+
+		all_moves = self.__moves
+		distances = self.__distances_to(end)
+		result = None
+		if begin in distances:
+			count = 0
+			heap = [(distances[begin], distances[begin], count, begin, None, None)]
+			came_from = dict()
+
+			while heap:
+				f, h, c, node, prev, direction = heapq.heappop(heap)
+				g = f - h
+				if node in came_from:
+					continue
+				came_from[node] = (prev, direction)
+
+				if node == end:
+					result = self.__trace_route(end, g, came_from)
+					break
+
+				if node in self.__red:
+					if not self.__release:
+						continue
+					g += 1
+
+				moves = all_moves[node]
+				if node in fixed:
+					forced = [move for move in moves if move[0] == fixed[node]]
+					if forced:
+						moves = forced
+				for move, pos in moves:
+					if pos in distances and pos not in came_from:
+						count += 1
+						heapq.heappush(heap, (g + 1 + distances[pos], distances[pos], count, pos, node, move))
+
+		self.__memo[key] = result
+		return result
+
+	def __distances_to(self, end):
+		"""Return dictionary of cell to its shortest relaxed route cost to end, for the A* estimate
+
+		Fixing junctions only removes moves, so these costs never overestimate. Cells missing
+		from the dictionary cannot reach end at all.
+		"""
+		if end not in self.__distances:
+			distances = dict()
+			if end in self.__moves:
+				heap = [(0, end)]
+				while heap:
+					cost, node = heapq.heappop(heap)
+					if node in distances:
+						continue
+					distances[node] = cost
+					for cell in self.__entering.get(node, []):
+						if cell in self.__red and not self.__release:
+							continue
+						if cell not in distances:
+							heapq.heappush(heap, (cost + (2 if cell in self.__red else 1), cell))
+			self.__distances[end] = distances
+		return self.__distances[end]
+
+	def __trace_route(self, end, cost, came_from):
+		"""Rebuild (cost, path, visits, released) for a route by following the A* parent links"""
+		cells = list()
+		node = end
+		while node is not None:
+			cells.append((node, came_from[node][1]))
+			node = came_from[node][0]
+		cells.reverse()
+
+		path = list()
+		visits = list()
+		released = list()
+		for i in range(len(cells) - 1):
+			node = cells[i][0]
+			direction = cells[i + 1][1]
+			if node in self.__red:
+				path.append("SIGNAL-CHANGE-RED-TO-GREEN")
+				released.append(node)
+			if node in self.__junction_cells:
+				visits.append((node, direction))
+			path.append(direction)
+		return cost, path, visits, released
+
+	def __expand(self, routes, fixed, results):
+		"""Branch one search node on the conflicting junction whose cheapest child costs the most
+
+		Every conflicting junction is tried, with ties going to the junction most routes use.
+		Conflicts between separate groups of routes each add their cheapest increase to the
+		node's lower bound. Returns (junction, children, extra) where children lists (cost,
+		fixed, route results) for each feasible setting and extra is the lower bound increase,
+		or (None, settings, 0) when the routes do not conflict.
+		"""
+		cost = sum(result[0] for result in results)
+		uses = self.__junction_uses(results)
+		conflicts = [junction for junction in sorted(uses) if len(uses[junction]) > 1]
+		if not conflicts:
+			settings = dict(fixed)
+			for junction, directions in uses.items():
+				settings[junction] = list(directions)[0]
+			return None, settings, 0
+
+		best = None
+		increases = list()
+		for junction in conflicts:
+			children = list()
+			for choice in self.get_options(junction[0], junction[1]):
+				child = dict(fixed)
+				child[junction] = choice
+				child_results = self.__resolve(routes, results, child, junction)
+				if child_results is not None:
+					children.append((sum(result[0] for result in child_results), child, child_results))
+			if not children:
+				return junction, children, 0
+			users = set().union(*uses[junction].values())
+			rank = (min(child[0] for child in children), len(users))
+			increases.append((rank[0] - cost, users))
+			if best is None or rank > best[0]:
+				best = (rank, junction, children)
+
+		extra = 0
+		claimed = set()
+		for increase, users in sorted(increases, key=lambda item: -item[0]):
+			if not users & claimed:
+				extra += increase
+				claimed |= users
+		return best[1], best[2], extra
+
+	def __resolve(self, routes, results, fixed, junction):
+		"""Return route results under fixed, re-searching only routes leaving junction another way
+
+		A route whose result already agrees with the new setting stays optimal, as adding a
+		setting only removes moves. Returns None when a route can no longer be found.
+		"""
+		resolved = list()
+		for (begin, end), result in zip(routes, results):
+			if not self.__consistent(result[2], {junction: fixed[junction]}):
+				result = self.search_route(begin, end, fixed)
+				if result is None:
+					return None
+			resolved.append(result)
+		return resolved
+
+	def __junction_uses(self, results):
+		"""Return dictionary of junction to {direction: set of route indexes leaving that way}"""
+		uses = dict()
+		for i, result in enumerate(results):
+			for junction, direction in result[2]:
+				uses.setdefault(junction, dict()).setdefault(direction, set()).add(i)
+		return uses
+
+	def __greedy(self, routes, fixed, first):
+		"""Quick feasible configuration fixing each route's junction exits before the next route
+
+		Routes are taken in order starting from index first. Gives the branch and bound a tight
+		first bound. Returns (cost, settings, route results) or None when routing in this order
+		fails.
+		"""
+		fixed = dict(fixed)
+		results = [None] * len(routes)
+		for i in list(range(first, len(routes))) + list(range(first)):
+			begin, end = routes[i]
+			while True:
+				result = self.search_route(begin, end, fixed)
+				if result is None:
+					return None
+				exits = dict()
+				for junction, direction in result[2]:
+					exits.setdefault(junction, direction)
+				clashes = [junction for junction, direction in result[2] if exits[junction] != direction]
+				if not clashes:
+					break
+				fixed[clashes[0]] = exits[clashes[0]]
+			fixed.update(exits)
+			results[i] = result
+		return sum(result[0] for result in results), fixed, results
+
+	def __solve_parallel(self, routes):
+		"""Expand the first levels of the search and solve each subtree in a worker process"""
+		leaves = list()
+		for i in range(len(routes)):
+			greedy = self.__greedy(routes, dict(), i)
+			if greedy is not None:
+				leaves.append(greedy)
+
+		results = [self.search_route(begin, end, dict()) for begin, end in routes]
+		frontier = [(sum(result[0] for result in results), dict(), results)]
+		while frontier and len(frontier) < self.__workers * Constants.OPTIMISER_TASKS_PER_WORKER:
+			frontier.sort(key=lambda node: node[0])
+			cost, fixed, results = frontier.pop(0)
+			if leaves and cost >= min(leaf[0] for leaf in leaves):
+				continue
+			conflict, children, extra = self.__expand(routes, fixed, results)
+			if conflict is None:
+				leaves.append((cost, children, results))
+				continue
+			frontier.extend(children)
+
+		candidates = list(leaves)
+		if frontier:
+			bound = min(leaf[0] for leaf in leaves) if leaves else 2 * len(self.__moves) * len(routes) + 1
+			shared_bound = multiprocessing.Value("i", bound)
+			with ProcessPoolExecutor(max_workers=self.__workers, initializer=_init_worker, initargs=(shared_bound,)) as pool:
+				futures = [pool.submit(_solve_subtree, self.__snapshot, self.__release, routes, fixed) for cost, fixed, results in sorted(frontier, key=lambda node: node[0])]
+				for future in futures:
+					result = future.result()
+					if result is not None:
+						candidates.append(result)
+
+		if not candidates:
+			return None
+		return min(candidates, key=lambda c: (c[0], sorted(c[1].items())))
+
+	def __consistent(self, visits, fixed):
+		"""Check whether the junction exits of a route agree with the fixed settings"""
+		for junction, direction in visits:
+			if fixed.get(junction, direction) != direction:
+				return False
+		return True
+
+
+def apply_configuration(system_map, config, release_signals=False):
+	"""Set the map's junctions (and optionally released signals to GREEN) from a JunctionConfiguration"""
+	grid = system_map.get_map()
+	for (x, y), direction in sorted(config.get_junctions().items()):
+		if grid[x][y].get_direction() != direction:
+			system_map.place_junction(x, y, direction)
+	if release_signals:
+		for x, y in config.get_released():
+			system_map.place_signal(x, y, "GREEN")
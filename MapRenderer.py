@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+"""Class to render a viewport window of a Train Signaling System map from cached tiles
+
+The map is split into square tiles of designator characters. A tile is rendered once and kept
+until an edit touches one of its cells, so the cost of a frame depends on the viewport size and
+not on the map size. The text layout matches SystemMap.render_map.
+"""
+
+import Constants
+
+
+class TileRenderer(object):
+	"""Viewport renderer for a SystemMap, caching rendered tiles until their cells change"""
+	def __init__(self, system_map, tile_size=Constants.TILE_SIZE):
+		if tile_size < 1:
+			raise ValueError("Tile size must be a positive integer")
+		self.__map = system_map
+		self.__size = system_map.get_size()
+		self.__tile_size = tile_size
+		self.__tiles = dict()
+		system_map.add_observer(self)
+
+	def get_tile_size(self):
+		return self.__tile_size
+
+	def get_cached_tiles(self):
+		return len(self.__tiles)
+
+	def clear_cache(self):
+		self.__tiles = dict()
+
+	def cell_changed(self, x, y, old, new):
+		"""SystemMap observer hook - drop the cached tile holding location (x, y)"""
+		self.__tiles.pop((x // self.__tile_size, y // self.__tile_size), None)
+
+	def clamp_viewport(self, x, y, width, height):
+		"""Fit a viewport window inside the map, returning the adjusted (x, y, width, height)"""
+		width = max(1, min(width, self.__size))
+		height = max(1, min(height, self.__size))
+		x = max(Constants.X_BOUNDS, min(x, self.__size - width))
+		y = max(Constants.Y_BOUNDS, min(y, self.__size - height))
+		return x, y, width, height
+
+	def follow(self, train, width, height):
+		"""Return the (x, y) origin of a viewport of the given size centred on the Train"""
+		x, y, width, height = self.clamp_viewport(train.get_x() - width // 2, train.get_y() - height // 2, width, height)
+		return x, y
+
+	def render(self, x, y, width, height, trains=None):
+		"""Return string representation of the viewport window with origin (x, y)"""
+		x, y, width, height = self.clamp_viewport(x, y, width, height)
+		t = self.__tile_size
+		overlay = dict()
+		if trains is not None:
+			for train in trains:
+				if x <= train.get_x() < x + width and y <= train.get_y() < y + height:
+					overlay.setdefault(train.get_y(), list()).append(train)
+
+		map_string = ""
+		for j in range(y, y + height):
+			row = ""
+			i = x
+			while i < x + width:
+				tile = self.__get_tile(i // t, j // t)
+				start = i % t
+				stop = min(t, start + x + width - i)
+				row += tile[j % t][start:stop]
+				i += stop - start
+
+			if j in overlay:
+				cells = list(row)
+				for train in overlay[j]:
+					cells[train.get_x() - x] = train.get_designator()
+				row = "".join(cells)
+
+			map_string += "   ".join(row) + "\n\n"
+		return map_string
+
+	def render_following(self, train, width, height, trains=None):
+		"""Return the viewport of the given size centred on the Train, drawing it on top"""
+		x, y = self.follow(train, width, height)
+		return self.render(x, y, width, height, [train] if trains is None else trains)
+
+	def __get_tile(self, tx, ty):
+		"""Return the cached tile (tx, ty) as a list of row strings, rendering it if needed"""
+		tile = self.__tiles.get((tx, ty))
+		if tile is None:
+			grid = self.__map.get_map()
+			t = self.__tile_size
+			tile = list()
+			for j in range(ty * t, min((ty + 1) * t, self.__size)):
+				row = ""
+				for i in range(tx * t, min((tx + 1) * t, self.__size)):
+					row += "." if grid[i][j] is None else grid[i][j].get_designator()
+				tile.append(row)
+			self.__tiles[(tx, ty)] = tile
+		return tile
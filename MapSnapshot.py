@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+"""Class for frozen, read-only views of the Train Signaling System map"""
+
+import Constants
+from collections import deque
+
+
+class MapSnapshot(object):
+	"""Read-only view of a SystemMap grid at the time the snapshot was taken"""
+	def __init__(self, grid, size, begin, end):
+		self.__grid = grid
+		self.__size = size
+		self.__begin = tuple(begin)
+		self.__end = tuple(end)
+
+	def get_size(self):
+		return self.__size
+
+	def get_begin(self):
+		return list(self.__begin)
+
+	def get_end(self):
+		return list(self.__end)
+
+	def get_object(self, x, y):
+		return self.__grid[x][y]
+
+	def check_valid_coords(self, x, y):
+		"""Function to check whether (x,y) coordinate on the map are valid"""
+		if x < self.__size and x >= Constants.X_BOUNDS and y < self.__size and y >= Constants.Y_BOUNDS:
+			return True
+		return False
+
+	def get_signal_state(self, x, y, overlay=None):
+		"""Return state of Signal at (x, y), taking any override in the overlay first"""
+		if overlay is not None and (x, y) in overlay:
+			return overlay[(x, y)]
+		return self.__grid[x][y].get_state()
+
+	def get_junction_direction(self, x, y, overlay=None):
+		"""Return direction of Junction at (x, y), taking any override in the overlay first"""
+		if overlay is not None and (x, y) in overlay:
+			return overlay[(x, y)]
+		return self.__grid[x][y].get_direction()
+
+	def get_neighbours(self, x, y):
+		"""Return list of (direction, (x, y)) pairs for occupied cells next to point (x, y)"""
+		neighbours = list()
+		for k, move in Constants.DIRECTION.items():
+			nx = x + move[0]
+			ny = y + move[1]
+			if self.check_valid_coords(nx, ny) and self.__grid[nx][ny] is not None:
+				neighbours.append((k, (nx, ny)))
+		return neighbours
+
+	def plan_route(self, begin=None, end=None, overlay=None):
+		"""Find the shortest path between beginning and ending using grid Breadth First Search
+
+		RED signals met along the way are released in the overlay dictionary, keyed by (x, y),
+		and junctions follow any direction given for them in the overlay. The snapshot itself is
+		never changed. Returns (found, path) in the same form as SystemMap.map_bfs.
+		"""
+		begin = self.__begin if begin is None else tuple(begin)
+		end = self.__end if end is None else tuple(end)
+		if overlay is None:
+			overlay = dict()
+
+		if not self.check_valid_coords(begin[0], begin[1]) or self.__grid[begin[0]][begin[1]] is None:
+			return False, []
+
+		q = deque([(begin, [])])
+		visited = set([begin])
+
+		while q:
+			node, path = q.popleft()
+
+			if node == end:
+				return True, path
+
+			obj = self.__grid[node[0]][node[1]]
+			neighbours = self.get_neighbours(node[0], node[1])
+
+			if obj.get_type() == "Signal":
+				if self.get_signal_state(node[0], node[1], overlay) == "RED":
+					q.append((node, path + ["SIGNAL-CHANGE-RED-TO-GREEN"]))
+					overlay[node] = "GREEN"
+					continue
+
+			elif obj.get_type() == "Junction":
+				junct_dir = self.get_junction_direction(node[0], node[1], overlay)
+				move = Constants.DIRECTION[junct_dir]
+				junct_coord = (node[0] + move[0], node[1] + move[1])
+
+				if (junct_dir, junct_coord) in neighbours:
+					if junct_coord not in visited:
+						q.append((junct_coord, path + [junct_dir]))
+						visited.add(junct_coord)
+					continue
+
+			for direction, pos in neighbours:
+				if pos not in visited:
+					q.append((pos, path + [direction]))
+					visited.add(pos)
+
+		return False, []
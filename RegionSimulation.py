@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+"""Run a Train Signaling System simulation split into column regions across worker processes"""
+
+import os
+import sys
+import time
+import argparse
+import Constants
+import multiprocessing
+from SystemMap import SystemMap
+from Simulation import Simulation, generate_trains
+
+
+def _send_batches(conn, tag, records):
+	"""Send records over a pipe in messages of at most Constants.HANDOFF_BATCH records"""
+	batch = Constants.HANDOFF_BATCH
+	for i in range(0, max(len(records), 1), batch):
+		conn.send((tag, records[i:i + batch], i + batch >= len(records)))
+
+
+def _recv_batches(conn, tag):
+	"""Receive every batch of records sent with _send_batches under the given tag"""
+	records = list()
+	last = False
+	while not last:
+		try:
+			msg_tag, chunk, last = conn.recv()
+		except EOFError:
+			raise RuntimeError("Region worker exited while {} records were expected".format(tag))
+		if msg_tag != tag:
+			raise ValueError("Expected {} records from region, received {}".format(tag, msg_tag))
+		records.extend(chunk)
+	return records
+
+
+def _region_worker(conn, routes, waits, bounds, halo):
+	"""Worker process loop simulating one region and the halo copies around it"""
+	x0, x1 = bounds
+	sim = Simulation(routes, waits)
+	own = dict((i, [index, hold]) for i, index, hold in _recv_batches(conn, "own"))
+
+	while True:
+		msg = conn.recv()
+		if msg[0] == "finish":
+			_send_batches(conn, "own", [(i, s[0], s[1]) for i, s in sorted(own.items())])
+			break
+
+		start_tick, ticks = msg[1], msg[2]
+		trains = dict(own)
+		for i, index, hold in _recv_batches(conn, "halo"):
+			trains[i] = [index, hold]
+
+		sim.load(trains, start_tick)
+		sim.run(ticks)
+
+		own = dict()
+		edge = list()
+		for i, state in sim.get_trains().items():
+			x = routes[i][state[0]][0]
+			if x0 <= x < x1:
+				own[i] = state
+				if x < x0 + halo or x >= x1 - halo:
+					edge.append((i, state[0], state[1]))
+		arrivals = [(i, t) for i, t in sim.get_arrivals().items() if x0 <= routes[i][-1][0] < x1]
+
+		_send_batches(conn, "edge", edge)
+		_send_batches(conn, "arrivals", arrivals)
+
+	conn.close()
+
+
+def partition_columns(routes, size, regions):
+	"""Split columns 0..size into contiguous strips holding similar numbers of route cells"""
+	weights = [0] * size
+	for route in routes.values():
+		for x, y in route:
+			weights[x] += 1
+
+	total = float(sum(weights)) or 1.0
+	bounds = list()
+	start = 0
+	acc = 0
+	for x in range(size):
+		acc += weights[x]
+		if len(bounds) < regions - 1 and acc >= total * (len(bounds) + 1) / regions and x + 1 < size:
+			bounds.append((start, x + 1))
+			start = x + 1
+	bounds.append((start, size))
+	return bounds
+
+
+def run_single(routes, waits, ticks):
+	"""Run the simulation in this process and return (trains, arrivals)"""
+	trains, arrivals = Simulation(routes, waits).run(ticks)
+	return dict((i, list(s)) for i, s in trains.items()), dict(arrivals)
+
+
+def run_partitioned(routes, waits, ticks, size, regions, window=Constants.SIM_WINDOW):
+	"""Run the simulation across region worker processes and return (trains, arrivals)"""
+	if window < 1:
+		raise ValueError("Simulation window must be at least 1 tick")
+	halo = 2 * window
+	bounds = partition_columns(routes, size, regions)
+
+	conns = list()
+	workers = list()
+	try:
+		for region in bounds:
+			parent_conn, child_conn = multiprocessing.Pipe()
+			p = multiprocessing.Process(target=_region_worker, args=(child_conn, routes, waits, region, halo))
+			p.start()
+			child_conn.close()
+			conns.append(parent_conn)
+			workers.append(p)
+
+		edges = list()
+		for (x0, x1), conn in zip(bounds, conns):
+			own = list()
+			for i in sorted(routes):
+				state = (i, 0, waits[i][0])
+				if x0 <= routes[i][0][0] < x1:
+					own.append(state)
+					if routes[i][0][0] < x0 + halo or routes[i][0][0] >= x1 - halo:
+						edges.append(state)
+			_send_batches(conn, "own", own)
+
+		arrivals = dict()
+		tick = 0
+		while tick < ticks:
+			span = min(window, ticks - tick)
+			for (x0, x1), conn in zip(bounds, conns):
+				halo_trains = list()
+				for state in edges:
+					x = routes[state[0]][state[1]][0]
+					if x0 - halo <= x < x0 or x1 <= x < x1 + halo:
+						halo_trains.append(state)
+				conn.send(("window", tick, span))
+				_send_batches(conn, "halo", halo_trains)
+
+			edges = list()
+			for conn in conns:
+				edges.extend(_recv_batches(conn, "edge"))
+				arrivals.update(_recv_batches(conn, "arrivals"))
+			tick += span
+
+		trains = dict()
+		for conn in conns:
+			conn.send(("finish",))
+			for i, index, hold in _recv_batches(conn, "own"):
+				trains[i] = [index, hold]
+	except BaseException:
+		for p in workers:
+			if p.is_alive():
+				p.terminate()
+		raise
+	finally:
+		for conn in conns:
+			conn.close()
+		for p in workers:
+			p.join()
+
+	return trains, arrivals
+
+
+def build_lattice_map(size):
+	"""Build a SystemMap with a lattice of track every 4 cells and scattered RED signals"""
+	sm = SystemMap(size)
+	for x in range(size):
+		for y in range(size):
+			if x % 4 == 0 and y % 16 == 2:
+				sm.place_signal(x, y, "RED")
+			elif x % 4 == 0 or y % 4 == 0:
+				sm.place_track(x, y)
+	return sm
+
+
+def Benchmark(args):
+	"""Time partitioned runs across worker counts and check each against a single-process run"""
+	print("Building {} x {} lattice map with {} trains".format(args.size, args.size, args.trains))
+	sm = build_lattice_map(args.size)
+	routes, waits = generate_trains(sm.snapshot(), args.trains, args.seed, args.route_length)
+
+	start = time.perf_counter()
+	reference = run_single(routes, waits, args.ticks)
+	baseline = time.perf_counter() - start
+	print("Single process: {:.3f}s for {} ticks".format(baseline, args.ticks))
+
+	counts = list()
+	n = 1
+	while n <= args.max_workers:
+		counts.append(n)
+		n *= 2
+
+	print("Regions  Seconds  Speedup  Matches")
+	for n in counts:
+		start = time.perf_counter()
+		result = run_partitioned(routes, waits, args.ticks, args.size, n, args.window)
+		elapsed = time.perf_counter() - start
+		print("{:7d}  {:7.3f}  {:7.2f}  {}".format(n, elapsed, baseline / elapsed, result == reference))
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Scaling benchmark for region-partitioned train simulation")
+	parser.add_argument("--size", type=int, default=400, help="Grid size of the lattice map")
+	parser.add_argument("--trains", type=int, default=5000, help="Number of trains")
+	parser.add_argument("--ticks", type=int, default=200, help="Number of ticks to simulate")
+	parser.add_argument("--route-length", type=int, default=Constants.SIM_ROUTE_LENGTH, help="Cells per train route")
+	parser.add_argument("--window", type=int, default=Constants.SIM_WINDOW, help="Ticks per synchronisation window")
+	parser.add_argument("--seed", type=int, default=0, help="Seed for train placement and routes")
+	parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1, help="Largest region count to benchmark")
+	Benchmark(parser.parse_args())
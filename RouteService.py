@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+
+"""Local route-query service for the Train Signal System
+
+The service loads a layout once and answers JSON lines requests over a Unix socket or a
+localhost TCP port. Each request is one JSON object with an "op" of "plan", "validate",
+"inspect" or "stats", and each response is one JSON object on its own line. Route searches
+run on a map snapshot in a pool of worker processes, so many requests are served at once.
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import Constants
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from SystemMap import SystemMap
+from EditJournal import EditJournal, object_to_spec
+from EventSink import BufferedSink
+
+
+_worker_snapshot = None
+
+
+def _init_worker(snapshot):
+	"""Worker process initialiser - keep one copy of the map snapshot for every search"""
+	global _worker_snapshot
+	_worker_snapshot = snapshot
+
+
+def _plan_worker(begin, end):
+	"""Worker process task - plan a route on the worker's copy of the map snapshot"""
+	result, path = _worker_snapshot.plan_route(begin, end, dict())
+	released = list()
+	if result:
+		position = list(begin)
+		for move in path:
+			if move in Constants.DIRECTION:
+				position = [position[0] + Constants.DIRECTION[move][0], position[1] + Constants.DIRECTION[move][1]]
+			elif move == "SIGNAL-CHANGE-RED-TO-GREEN" and position not in released:
+				released.append(position)
+	return result, path, sorted(released)
+
+
+def percentile(values, pct):
+	"""Return the nearest-rank percentile of a list of numbers (0 when empty)"""
+	if not values:
+		return 0
+	ordered = sorted(values)
+	rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+	return ordered[rank]
+
+
+class RouteService(object):
+	"""Asyncio service answering plan, validate and inspect requests for one SystemMap"""
+	def __init__(self, system_map, workers=None):
+		self.__map = system_map
+		self.__snapshot = system_map.snapshot()
+		self.__workers = workers
+		self.__pool = None
+		self.__server = None
+		self.__latencies = deque(maxlen=Constants.SERVICE_LATENCY_WINDOW)
+		self.__requests = 0
+		self.__clients = set()
+
+		# The served layout is fixed at the snapshot, so it is validated once for every request
+		sink = system_map.get_sink()
+		errors = BufferedSink(["validation_error"])
+		system_map.set_sink(errors)
+		try:
+			valid = system_map.validate_map()
+		finally:
+			system_map.set_sink(sink)
+		self.__validation = {"valid": valid, "errors": errors.get_messages()}
+
+	def get_latencies(self):
+		return list(self.__latencies)
+
+	def get_stats(self):
+		"""Return request count and latency percentiles in milliseconds over the latest requests"""
+		latencies = list(self.__latencies)
+		return {
+			"requests": self.__requests,
+			"p50_ms": percentile(latencies, 50),
+			"p90_ms": percentile(latencies, 90),
+			"p99_ms": percentile(latencies, 99)
+		}
+
+	async def start(self, host=None, port=None, path=None):
+		"""Start listening on a Unix socket path, or on a localhost TCP port otherwise"""
+		self.__pool = ProcessPoolExecutor(max_workers=self.__workers, initializer=_init_worker, initargs=(self.__snapshot,))
+		if path is not None:
+			self.__server = await asyncio.start_unix_server(self.__handle_client, path=path)
+		else:
+			host = Constants.SERVICE_HOST if host is None else host
+			port = Constants.SERVICE_PORT if port is None else port
+			self.__server = await asyncio.start_server(self.__handle_client, host=host, port=port)
+		return self.__server
+
+	async def serve_forever(self):
+		async with self.__server:
+			await self.__server.serve_forever()
+
+	async def stop(self):
+		"""Stop accepting connections and shut the worker pool down"""
+		if self.__server is not None:
+			self.__server.close()
+			for client in list(self.__clients):
+				client.cancel()
+			await asyncio.gather(*self.__clients, return_exceptions=True)
+			await self.__server.wait_closed()
+			self.__server = None
+		if self.__pool is not None:
+			self.__pool.shutdown()
+			self.__pool = None
+
+	async def handle_request(self, request):
+		"""Answer a single decoded request and return the response dictionary"""
+		if not isinstance(request, dict):
+			raise TypeError("Request must be a JSON object")
+		op = request.get("op")
+
+		if op == "plan":
+			begin = self.__parse_location(request.get("begin", self.__snapshot.get_begin()), "begin")
+			end = self.__parse_location(request.get("end", self.__snapshot.get_end()), "end")
+			loop = asyncio.get_running_loop()
+			result, path, released = await loop.run_in_executor(self.__pool, _plan_worker, begin, end)
+			return {"ok": True, "found": result, "path": path, "released": released}
+
+		elif op == "validate":
+			return dict(ok=True, valid=self.__validation["valid"], errors=list(self.__validation["errors"]))
+
+		elif op == "inspect":
+			x = int(request["x"])
+			y = int(request["y"])
+			if not self.__snapshot.check_valid_coords(x, y):
+				raise ValueError("Invalid X, Y coordinate given at ({}, {})".format(x, y))
+			return {"ok": True, "object": object_to_spec(self.__snapshot.get_object(x, y))}
+
+		elif op == "stats":
+			return dict(ok=True, **self.get_stats())
+
+		raise ValueError("Unknown request op: {}".format(op))
+
+	def __parse_location(self, value, name):
+		"""Return a request location as a list of two integer map coordinates"""
+		if not isinstance(value, (list, tuple)) or len(value) != 2 or not all(type(v) is int for v in value):
+			raise ValueError("Request {} must be a list of two integers".format(name))
+		if not self.__snapshot.check_valid_coords(value[0], value[1]):
+			raise ValueError("Invalid X, Y coordinate given for {} at ({}, {})".format(name, value[0], value[1]))
+		return list(value)
+
+	async def __handle_client(self, reader, writer):
+		"""Read JSON lines requests from one client, answering each in its own task"""
+		lock = asyncio.Lock()
+		tasks = set()
+		client = asyncio.current_task()
+		self.__clients.add(client)
+		try:
+			while True:
+				line = await reader.readline()
+				if not line:
+					break
+				task = asyncio.ensure_future(self.__answer(line, writer, lock))
+				tasks.add(task)
+				task.add_done_callback(tasks.discard)
+			if tasks:
+				await asyncio.gather(*tasks)
+		except (asyncio.CancelledError, ConnectionError):
+			for task in tasks:
+				task.cancel()
+		finally:
+			self.__clients.discard(client)
+			writer.close()
+
+	async def __answer(self, line, writer, lock):
+		"""Decode, answer and write back one request line, recording its latency"""
+		start = time.perf_counter()
+		request = dict()
+		try:
+			request = json.loads(line)
+			response = await self.handle_request(request)
+		except (ValueError, KeyError, TypeError) as e:
+			response = {"ok": False, "error": str(e)}
+		except Exception as e:
+			response = {"ok": False, "error": "Request failed: {}: {}".format(type(e).__name__, e)}
+		if isinstance(request, dict) and "id" in request:
+			response["id"] = request["id"]
+		self.__requests += 1
+		self.__latencies.append((time.perf_counter() - start) * 1000.0)
+
+		async with lock:
+			writer.write((json.dumps(response) + "\n").encode())
+			await writer.drain()
+
+
+class RouteClient(object):
+	"""Asyncio JSON lines client for a local RouteService, matching responses by request id"""
+	def __init__(self):
+		self.__reader = None
+		self.__writer = None
+		self.__next_id = 0
+		self.__waiting = dict()
+		self.__listener = None
+
+	async def connect(self, host=None, port=None, path=None):
+		if path is not None:
+			self.__reader, self.__writer = await asyncio.open_unix_connection(path)
+		else:
+			host = Constants.SERVICE_HOST if host is None else host
+			port = Constants.SERVICE_PORT if port is None else port
+			self.__reader, self.__writer = await asyncio.open_connection(host, port)
+		self.__listener = asyncio.ensure_future(self.__listen())
+
+	async def close(self):
+		self.__writer.close()
+		await self.__writer.wait_closed()
+		await self.__listener
+
+	async def request(self, op, **params):
+		"""Send one request and wait for its response"""
+		self.__next_id += 1
+		request_id = self.__next_id
+		future = asyncio.get_running_loop().create_future()
+		self.__waiting[request_id] = future
+		params.update(op=op, id=request_id)
+		self.__writer.write((json.dumps(params) + "\n").encode())
+		await self.__writer.drain()
+		return await future
+
+	async def __listen(self):
+		while True:
+			line = await self.__reader.readline()
+			if not line:
+				break
+			response = json.loads(line)
+			future = self.__waiting.pop(response.get("id"), None)
+			if future is not None and not future.done():
+				future.set_result(response)
+
+		for future in self.__waiting.values():
+			if not future.done():
+				future.set_exception(ConnectionError("Route service closed the connection"))
+		self.__waiting.clear()
+
+
+def LoadLayout(args):
+	"""Build the SystemMap served by the service from a journal change log or the preset map"""
+	sm = SystemMap(args.size)
+	if args.journal is not None:
+		EditJournal(sm).load(args.journal)
+	else:
+		sm.preset_map()
+	return sm
+
+
+async def RunService(args):
+	service = RouteService(LoadLayout(args), args.workers)
+	await service.start(args.host, args.port, args.unix)
+	try:
+		await service.serve_forever()
+	finally:
+		await service.stop()
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Local route-query service for the Train Signal System")
+	parser.add_argument("--size", type=int, default=Constants.MAX_SIZE, help="Grid size of the served map")
+	parser.add_argument("--journal", help="Edit journal change log to load instead of the preset map")
+	parser.add_argument("--host", default=Constants.SERVICE_HOST, help="Host to listen on for TCP")
+	parser.add_argument("--port", type=int, default=Constants.SERVICE_PORT, help="Port to listen on for TCP")
+	parser.add_argument("--unix", help="Unix socket path to listen on instead of TCP")
+	parser.add_argument("--workers", type=int, default=None, help="Number of route search worker processes")
+	args = parser.parse_args()
+
+	try:
+		asyncio.run(RunService(args))
+	except KeyboardInterrupt:
+		sys.exit(0)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+"""Class to run a tick-based simulation of many trains on a Train Signaling System map
+
+Every train follows its own precomputed route of cells. At each tick a train that is not
+holding at a RED signal moves one cell along its route if the next cell was free at the start
+of the tick, and when several trains want the same free cell the lowest train id takes it.
+A train reaching the last cell of its route stops and leaves the map. The simulation is fully
+deterministic for a given set of routes, so runs can be compared exactly.
+"""
+
+import random
+import Constants
+
+
+def generate_trains(snapshot, count, seed, route_length=Constants.SIM_ROUTE_LENGTH):
+	"""Build seeded random routes for up to count trains on a MapSnapshot
+
+	Trains start on distinct occupied cells and walk along the track without turning back,
+	following the direction of any Junction they pass. A walk ends early at a terminator.
+	Returns (routes, waits) dictionaries keyed by train id, where waits gives the ticks a
+	train holds at each route index (RED signals hold for Constants.SIGNAL_DWELL ticks).
+	"""
+	rng = random.Random(seed)
+	size = snapshot.get_size()
+	cells = list()
+	for x in range(size):
+		for y in range(size):
+			if snapshot.get_object(x, y) is not None:
+				cells.append((x, y))
+
+	routes = dict()
+	waits = dict()
+	for train_id, start in enumerate(rng.sample(cells, min(count, len(cells)))):
+		route = [start]
+		prev = None
+		node = start
+		for i in range(route_length):
+			neighbours = snapshot.get_neighbours(node[0], node[1])
+			options = [pos for direction, pos in neighbours if pos != prev]
+			obj = snapshot.get_object(node[0], node[1])
+			if obj.get_type() == "Junction":
+				forced = [pos for direction, pos in neighbours if direction == obj.get_direction()]
+				if forced:
+					options = forced
+			if not options:
+				break
+			prev = node
+			node = rng.choice(options)
+			route.append(node)
+
+		hold = list()
+		for x, y in route:
+			obj = snapshot.get_object(x, y)
+			if obj.get_type() == "Signal" and obj.get_state() == "RED":
+				hold.append(Constants.SIGNAL_DWELL)
+			else:
+				hold.append(0)
+
+		routes[train_id] = tuple(route)
+		waits[train_id] = tuple(hold)
+
+	return routes, waits
+
+
+class Simulation(object):
+	"""Deterministic tick-based simulation of trains following precomputed routes"""
+	def __init__(self, routes, waits):
+		self.__routes = routes
+		self.__waits = waits
+		self.__tick = 0
+		self.__arrivals = dict()
+		self.__trace = None
+		self.__trains = dict()
+		for train_id in routes:
+			self.__trains[train_id] = [0, waits[train_id][0]]
+
+	def get_tick(self):
+		return self.__tick
+
+	def get_trains(self):
+		"""Return dictionary of train id to [route index, hold ticks] for trains still running"""
+		return self.__trains
+
+	def get_arrivals(self):
+		"""Return dictionary of train id to the tick the train reached the end of its route"""
+		return self.__arrivals
+
+	def get_position(self, train_id):
+		return self.__routes[train_id][self.__trains[train_id][0]]
+
+	def load(self, trains, tick):
+		"""Replace running trains with a dictionary of id to [route index, hold ticks] at a tick"""
+		self.__trains = trains
+		self.__tick = tick
+		self.__arrivals = dict()
+		self.__trace = None
+
+	def step(self, trace=None):
+		"""Advance every train by one tick, recording moves and arrivals to an optional TraceWriter
+
+		The first step given a trace also records where every running train currently is.
+		"""
+		routes = self.__routes
+		trains = self.__trains
+		if trace is not None and trace is not self.__trace:
+			for train_id in sorted(trains):
+				x, y = routes[train_id][trains[train_id][0]]
+				trace.record_move(self.__tick, train_id, x, y)
+			self.__trace = trace
+		self.__tick += 1
+		if trace is not None:
+			trace.set_tick(self.__tick)
+
+		occupied = set()
+		for train_id, state in trains.items():
+			occupied.add(routes[train_id][state[0]])
+
+		claimed = set()
+		moving = list()
+		arrived = list()
+		for train_id in sorted(trains):
+			state = trains[train_id]
+			if state[1] > 0:
+				state[1] -= 1
+				continue
+			route = routes[train_id]
+			if state[0] == len(route) - 1:
+				arrived.append(train_id)
+				continue
+			target = route[state[0] + 1]
+			if target in occupied or target in claimed:
+				continue
+			claimed.add(target)
+			moving.append(train_id)
+
+		for train_id in moving:
+			state = trains[train_id]
+			state[0] += 1
+			state[1] = self.__waits[train_id][state[0]]
+			if trace is not None:
+				x, y = routes[train_id][state[0]]
+				trace.record_move(self.__tick, train_id, x, y)
+
+		for train_id in arrived:
+			if trace is not None:
+				x, y = routes[train_id][trains[train_id][0]]
+				trace.record_arrival(self.__tick, train_id, x, y)
+			del trains[train_id]
+			self.__arrivals[train_id] = self.__tick
+
+	def run(self, ticks, trace=None):
+		"""Advance the simulation by a number of ticks and return (trains, arrivals)"""
+		for i in range(ticks):
+			self.step(trace)
+		return self.__trains, self.__arrivals
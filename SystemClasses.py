@@ -21,11 +21,12 @@ import Constants
 
 class TrackObject(object):
 	"""Base class for any object being placed to a coordinate on the map as part of a track"""
-	def __init__(self, x, y, type, designator):
+	def __init__(self, x, y, type, designator, max_size=Constants.MAX_SIZE):
 		self.__x = x
 		self.__y = y
 		self.__type = type
 		self.__designator = designator.upper()
+		self.__max_size = max_size
 
 	def get_x(self):
 		return self.__x
@@ -42,13 +43,16 @@ class TrackObject(object):
 	def get_position(self):
 		return [self.__x, self.__y]
 
+	def get_max_size(self):
+		return self.__max_size
+
 	def set_x(self, new_x):
-		if new_x < Constants.X_BOUNDS or new_x > Constants.MAX_SIZE:
+		if new_x < Constants.X_BOUNDS or new_x > self.__max_size:
 			raise ValueError("Position X value is out of bounds")
 		self.__x = new_x
 
 	def set_y(self, new_y):
-		if new_y < Constants.Y_BOUNDS or new_y > Constants.MAX_SIZE:
+		if new_y < Constants.Y_BOUNDS or new_y > self.__max_size:
 			raise ValueError("Position Y value is out of bounds")
 		self.__y = new_y
 
@@ -148,8 +152,8 @@ class Junction(TrackObject):
 
 class Train(TrackObject):
 	"""Class reprenting a Train object which traverses the map"""
-	def __init__(self, x, y, direction, moving):
-		super().__init__(x, y, "Train", "*")
+	def __init__(self, x, y, direction, moving, max_size=Constants.MAX_SIZE):
+		super().__init__(x, y, "Train", "*", max_size)
 		self.__direction = direction
 		self.__moving = moving
 
@@ -8,28 +8,34 @@ import time
 import string
 import datetime
 import Constants
-from queue import Queue
+from MapSnapshot import MapSnapshot
+from EventSink import NullSink
+from MapRenderer import TileRenderer
 from SystemClasses import BeginningPoint, EndPoint, TrackSegment, Signal, Junction, Train
 
 
 class SystemMap(object):
-	"""Class responsible for building and managing the map (Cartesian grid)"""
-	def __init__(self, size):
+	"""Class responsible for building and managing the map (Cartesian grid)
+
+	All output goes to the EventSink given at construction - by default a NullSink, so building
+	and editing a map as a library is quiet.
+	"""
+	def __init__(self, size, sink=None):
 		self.__size = size
+		self.__sink = NullSink() if sink is None else sink
 		self.__map = list()
-		self.__visited = list()
 		self.__begin = [-1, -1]
 		self.__end = [-1, -1]
+		self.__observers = list()
+		self.__shared = False
+		self.__owned = set(range(self.__size))
 
 		for i in range(self.__size):
 			row = [None] * self.__size
-			visit = [False] * self.__size
 			self.__map.append(row)
-			self.__visited.append(visit)
 
 		self.draw_map()
-		print("System Map Created - Size {} x {}".format(self.__size, self.__size))
-		print("Origin (0, 0) is at the TOP LEFT corner - All values are positive\n")
+		self.__emit("map_created", size=self.__size)
 
 	def get_size(self):
 		return self.__size
@@ -37,15 +43,76 @@ class SystemMap(object):
 	def get_map(self):
 		return self.__map
 
-	def get_visited(self):
-		return self.__visited
-
 	def get_begin(self):
 		return self.__begin
 
 	def get_end(self):
 		return self.__end
 
+	def get_sink(self):
+		return self.__sink
+
+	def set_sink(self, new_sink):
+		self.__sink = NullSink() if new_sink is None else new_sink
+
+	def __emit(self, kind, **data):
+		"""Send an event to the sink if it accepts events of this kind"""
+		if self.__sink.accepts(kind):
+			self.__sink.emit(kind, data)
+
+	def set_begin(self, new_begin):
+		if len(new_begin) != 2:
+			raise IndexError("Position must be array of 2 elements - Length given was: {}".format(len(new_begin)))
+		self.__begin = list(new_begin)
+
+	def set_end(self, new_end):
+		if len(new_end) != 2:
+			raise IndexError("Position must be array of 2 elements - Length given was: {}".format(len(new_end)))
+		self.__end = list(new_end)
+
+	def add_observer(self, observer):
+		"""Register an object notified through cell_changed(x, y, old, new), and edit_done() if it has one"""
+		if observer not in self.__observers:
+			self.__observers.append(observer)
+
+	def remove_observer(self, observer):
+		"""Stop notifying a previously registered observer of map edits"""
+		if observer in self.__observers:
+			self.__observers.remove(observer)
+
+	def snapshot(self):
+		"""Return an O(1) read-only MapSnapshot sharing the grid until the next edit copies it"""
+		self.__shared = True
+		return MapSnapshot(self.__map, self.__size, self.__begin, self.__end)
+
+	def __set_cell(self, x, y, obj):
+		"""Store object (or None) at location (x, y) and notify observers of the change"""
+		if self.__shared:
+			self.__map = list(self.__map)
+			self.__owned = set()
+			self.__shared = False
+		if x not in self.__owned:
+			self.__map[x] = list(self.__map[x])
+			self.__owned.add(x)
+
+		old = self.__map[x][y]
+		self.__map[x][y] = obj
+		for observer in self.__observers:
+			observer.cell_changed(x, y, old, obj)
+
+	def __edit_done(self):
+		"""Tell observers that a complete edit, including begin and end updates, has been applied"""
+		for observer in self.__observers:
+			edit_done = getattr(observer, "edit_done", None)
+			if edit_done is not None:
+				edit_done()
+
+	def restore_cell(self, x, y, obj):
+		"""Store object (or None) at location (x, y) without drawing, for replaying recorded edits"""
+		if not self.check_valid_coords(x, y):
+			raise ValueError("Invalid X, Y coordinate given at ({}, {})".format(x, y))
+		self.__set_cell(x, y, obj)
+
 	def add_coords(self, pos1, pos2):
 		"""Adds set of (x1, y1) coordinates to (x2, y2) coordinates and returns"""
 		new_x = pos1[0] + pos2[0]
@@ -76,81 +143,89 @@ class SystemMap(object):
 		return coords, travels, types
 
 	def inspect_object(self, x, y):
-		"""Outputs string representation of common object properties at location (x, y)"""
+		"""Return dictionary of common object properties at location (x, y), or None when empty"""
 		obj = self.__map[x][y]
 		if obj is None:
-			print("No Track Object (None) is present at coordinates ({}, {})\n".format(x, y))
+			props = None
 		else:
 			obj_type = obj.get_type()
-			print("TrackObject Type: {}".format(obj_type))
-			print("{} Designator: {}".format(obj_type, obj.get_designator()))
-			print("{} X Location: {}".format(obj_type, obj.get_x()))
-			print("{} Y Location: {}".format(obj_type, obj.get_y()))
+			props = {
+				"type": obj_type,
+				"designator": obj.get_designator(),
+				"x": obj.get_x(),
+				"y": obj.get_y()
+			}
 			if obj_type == "Signal":
-				print("{} State: {}".format(obj_type, obj.get_state()))
+				props["state"] = obj.get_state()
 			if obj_type == "Junction":
-				print("{} Direction: {}".format(obj_type, obj.get_direction()))
+				props["direction"] = obj.get_direction()
 			if obj_type == "Train":
-				print("{} Direction: {}".format(obj_type, obj.get_direction()))
-				print("{} Moving: {}".format(obj_type, obj.get_moving()))
-			print("\n")
+				props["direction"] = obj.get_direction()
+				props["moving"] = obj.get_moving()
+		self.__emit("object_inspected", x=x, y=y, object=props)
+		return props
 
 	def remove_object(self, x, y):
 		"""Remove or reset element at location (x, y) from the map"""
-		self.__map[x][y] = None
-		self.__visited[x][y] = False
+		self.__set_cell(x, y, None)
+		self.__edit_done()
 		self.draw_map()
-		print("Map object removed at ({}, {}) - coordinate is now 'None'\n".format(x, y))
+		self.__emit("object_removed", x=x, y=y)
 
 	def place_beginning(self, x, y):
 		"""Place BeginningPoint object on map"""
 		if self.check_valid_coords(x, y):
-			self.__map[x][y] = BeginningPoint(x, y)
+			self.__set_cell(x, y, BeginningPoint(x, y))
 			self.__begin = [x, y]
+			self.__edit_done()
 			self.draw_map()
-			print("BeginningPoint object added to map ({}, {})\n".format(x, y))
+			self.__emit("object_placed", name="BeginningPoint", x=x, y=y)
 		else:
 			raise ValueError("Invalid X, Y coordinate given at ({}, {})".format(x, y))
 
 	def place_endpoint(self, x, y):
 		"""Place EndPoint object map"""
 		if self.check_valid_coords(x, y):
-			self.__map[x][y] = EndPoint(x, y)
+			self.__set_cell(x, y, EndPoint(x, y))
 			self.__end = [x, y]
+			self.__edit_done()
 			self.draw_map()
-			print("EndPoint object added to map ({}, {})\n".format(x, y))
+			self.__emit("object_placed", name="EndPoint", x=x, y=y)
 		else:
 			raise ValueError("Invalid X, Y coordinate given at ({}, {})".format(x, y))
 
 	def place_track(self, x, y):
 		"""Place TrackSegment object on map"""
 		if self.check_valid_coords(x, y):
-			self.__map[x][y] = TrackSegment(x, y)
+			self.__set_cell(x, y, TrackSegment(x, y))
+			self.__edit_done()
 			self.draw_map()
-			print("TrackSegment object added to map ({}, {})\n".format(x, y))
+			self.__emit("object_placed", name="TrackSegment", x=x, y=y)
 		else:
 			raise ValueError("Invalid X, Y coordinate given at ({}, {})".format(x, y))
 
 	def place_signal(self, x, y, state):
 		"""Place Signal object on map"""
 		if self.check_valid_coords(x, y):
-			self.__map[x][y] = Signal(x, y, state)
+			self.__set_cell(x, y, Signal(x, y, state))
+			self.__edit_done()
 			self.draw_map()
-			print("Signal object added to map ({}, {})\n".format(x, y))
+			self.__emit("object_placed", name="Signal", x=x, y=y)
 		else:
 			raise ValueError("Invalid X, Y coordinate given at ({}, {})".format(x, y))
 
 	def place_junction(self, x, y, direction):
 		"""Place Junction object on map"""
 		if self.check_valid_coords(x, y):
-			self.__map[x][y] = Junction(x, y, direction)
+			self.__set_cell(x, y, Junction(x, y, direction))
+			self.__edit_done()
 			self.draw_map()
-			print("Junction object added to map ({}, {})\n".format(x, y))
+			self.__emit("object_placed", name="Junction", x=x, y=y)
 		else:
 			raise ValueError("Invalid X, Y coordinate given at ({}, {})".format(x, y))
 
-	def draw_map(self, train=None):
-		"""Outputs current map representation to console"""
+	def render_map(self, train=None):
+		"""Return string representation of the current map, with the Train drawn on top if given"""
 		map_string = ""
 		for i in range(self.__size):
 			for j in range(self.__size):
@@ -174,7 +249,12 @@ class SystemMap(object):
 							map_string += "   " + self.__map[j][i].get_designator()
 
 			map_string += "\n\n"
-		print(map_string)
+		return map_string
+
+	def draw_map(self, train=None):
+		"""Outputs current map representation to the event sink"""
+		if self.__sink.accepts("map_drawn"):
+			self.__emit("map_drawn", text=self.render_map(train))
 
 	def validate_map(self):
 		"""Check placement of all objects on map before running"""
@@ -190,12 +270,12 @@ class SystemMap(object):
 						dir_move = Constants.DIRECTION[self.__map[i][j].get_direction()]
 						temp_move = self.add_coords([i, j], dir_move)
 						if temp_move not in travels:
-							print("Invalid Direction property for TrackObject at ({}, {})".format(i, j))
-							print("Map must have object in Direction of movement\n")
+							self.__emit("validation_error", x=i, y=j, message="Invalid Direction property for TrackObject at ({}, {})\n"
+								"Map must have object in Direction of movement\n".format(i, j))
 							return False
 						elif len(types) < 3:
-							print("Invalid placement of Junction at ({}, {})".format(i, j))
-							print("Junctions must have at least 3 surrounding objects\n")
+							self.__emit("validation_error", x=i, y=j, message="Invalid placement of Junction at ({}, {})\n"
+								"Junctions must have at least 3 surrounding objects\n".format(i, j))
 							return False
 
 					else:
@@ -204,35 +284,39 @@ class SystemMap(object):
 						if self.__map[i][j].get_type() == "End":
 							e_count += 1
 						if len(types) < 1:
-							print("Invalid placement of Track Object at ({}, {})".format(i, j))
-							print("Track Objects must have at least 1 surrounding objects\n")
+							self.__emit("validation_error", x=i, y=j, message="Invalid placement of Track Object at ({}, {})\n"
+								"Track Objects must have at least 1 surrounding objects\n".format(i, j))
 							return False
 
 		if b_count != 1:
-			print("Map must have 1 BeginningPoint defined to run\n")
+			self.__emit("validation_error", message="Map must have 1 BeginningPoint defined to run\n")
 			return False
 		if e_count != 1:
-			print("Map must have 1 EndPoint defined to run\n")
+			self.__emit("validation_error", message="Map must have 1 EndPoint defined to run\n")
 			return False
 
 		return True
 
 	def clear_map(self):
 		"""Clears all objects in a train map to reset the grid"""
+		for i in range(self.__size):
+			for j in range(self.__size):
+				if self.__map[i][j] is not None:
+					self.__set_cell(i, j, None)
+
 		self.__map = list()
-		self.__visited = list()
 		self.__begin = [-1, -1]
 		self.__end = [-1, -1]
+		self.__shared = False
+		self.__owned = set(range(self.__size))
 
 		for i in range(self.__size):
 			row = [None] * self.__size
-			visit = [False] * self.__size
 			self.__map.append(row)
-			self.__visited.append(visit)
 
+		self.__edit_done()
 		self.draw_map()
-		print("System Map Reset - Size {} x {}".format(self.__size, self.__size))
-		print("Origin (0, 0) is at the TOP LEFT corner - All values are positive\n")
+		self.__emit("map_cleared", size=self.__size)
 
 	def preset_map(self):
 		"""Build a sample train map for testing and validation"""
@@ -280,88 +364,62 @@ class SystemMap(object):
 
 		self.place_endpoint(8, 8)
 
-		print("Preset map loaded to system !!!\n")
+		self.__emit("preset_loaded")
 
 	def map_bfs(self):
-		"""Find the shortest path between beginning and ending on the track using grid Breadth First Search"""
-		q_start = [self.__begin, []]
-		q = Queue()
-		q.put(q_start)
-		self.__visited[self.__begin[0]][self.__begin[1]] == True
-
-		while q.qsize() != 0:
-			q_obj = q.get()
-			node = q_obj[0]
-			path = q_obj[1]
-
-			if node == self.__end:
-				return True, path
-			
-			coords, travels, types = self.get_surrounding_data(node[0], node[1])
-			move_up = self.add_coords(node, Constants.DIRECTION["UP"])
-			move_down = self.add_coords(node, Constants.DIRECTION["DOWN"])
-			move_left = self.add_coords(node, Constants.DIRECTION["LEFT"])
-			move_right = self.add_coords(node, Constants.DIRECTION["RIGHT"])
-
-			if self.__map[node[0]][node[1]].get_type() == "Signal":
-				if self.__map[node[0]][node[1]].get_state() == "RED":
-					path_wait = path + ["SIGNAL-CHANGE-RED-TO-GREEN"]
-					q.put([node, path_wait])
-					self.__visited[node[0]][node[1]] == True
-					self.__map[node[0]][node[1]].set_state("GREEN")
-					continue
-
-			elif self.__map[node[0]][node[1]].get_type() == "Junction":
-				junct_dir = self.__map[node[0]][node[1]].get_direction()
-				junct_coord = self.add_coords(node, Constants.DIRECTION[junct_dir])
-
-				if junct_coord in travels:
-					junct_path = path + [junct_dir]
-					q.put([junct_coord, junct_path])
-					self.__visited[junct_coord[0]][junct_coord[1]] == True
-					continue
-
-			if move_up in travels and self.__visited[move_up[0]][move_up[1]] == False:
-				path_up = path + ["UP"]
-				q.put([move_up, path_up])
-				self.__visited[move_up[0]][move_up[1]] == True
-
-			if move_down in travels and self.__visited[move_down[0]][move_down[1]] == False:
-				path_down = path + ["DOWN"]
-				q.put([move_down, path_down])
-				self.__visited[move_down[0]][move_down[1]] == True
-
-			if move_left in travels and self.__visited[move_left[0]][move_left[1]] == False:
-				path_left = path + ["LEFT"]
-				q.put([move_left, path_left])
-				self.__visited[move_left[0]][move_left[1]] == True
-
-			if move_right in travels and self.__visited[move_right[0]][move_right[1]] == False:
-				path_right = path + ["RIGHT"]
-				q.put([move_right, path_right])
-				self.__visited[move_right[0]][move_right[1]] == True
-
-		return False, []
-
-	def drive_train(self, path):
-		"""Animate Train object travelling along the found path on the system map in console"""
-		print("!!! Train is leaving the station !!!")
-		t = Train(self.__begin[0], self.__begin[1], path[0], False)
-		self.draw_map(t)
-		time.sleep(1)
-
-		for moves in path:
-			if moves not in Constants.DIRECTION.keys():
-				print("!!! Train stopping to wait for track action !!!")
-				print("Action: {}".format(moves))
-				t.set_moving(False)
-				time.sleep(2)
-			else:
-				t.set_direction(moves)
-				t.set_moving(True)
-				t.move()
-				time.sleep(1)
-			self.draw_map(t)
-
-		print("!!! Train has arrived !!!")
+		"""Find the shortest path between beginning and ending on the track using grid Breadth First Search
+
+		Planning runs on a snapshot, so RED signals released along the path are recorded in a
+		per-query overlay and the live map is left unchanged for the next query.
+		"""
+		return self.snapshot().plan_route()
+
+	def drive_train(self, path, delay=0, viewport=None, trace=None):
+		"""Animate Train object travelling along the found path, waiting delay seconds per move
+
+		With a (width, height) viewport only that window, following the Train, is drawn each frame.
+		With a Trace.TraceWriter every step of the path is recorded as one tick of a trace.
+		"""
+		renderer = None if viewport is None else TileRenderer(self)
+		self.__emit("train_departed")
+		t = Train(self.__begin[0], self.__begin[1], path[0], False, self.__size - 1)
+		try:
+			if trace is not None:
+				trace.record_move(0, 0, t.get_x(), t.get_y())
+			self.__draw_frame(t, renderer, viewport)
+			time.sleep(delay)
+
+			for tick, moves in enumerate(path, 1):
+				if moves not in Constants.DIRECTION.keys():
+					self.__emit("train_waiting", action=moves, x=t.get_x(), y=t.get_y())
+					if trace is not None:
+						trace.record_wait(tick, 0, t.get_x(), t.get_y())
+						obj = self.__map[t.get_x()][t.get_y()]
+						if moves == "SIGNAL-CHANGE-RED-TO-GREEN" and obj is not None and obj.get_type() == "Signal":
+							trace.record_signal(tick, t.get_x(), t.get_y(), "GREEN")
+					t.set_moving(False)
+					time.sleep(2 * delay)
+				else:
+					t.set_direction(moves)
+					t.set_moving(True)
+					t.move()
+					self.__emit("train_moved", direction=moves, x=t.get_x(), y=t.get_y())
+					if trace is not None:
+						trace.record_move(tick, 0, t.get_x(), t.get_y())
+					time.sleep(delay)
+				self.__draw_frame(t, renderer, viewport)
+		finally:
+			if renderer is not None:
+				self.remove_observer(renderer)
+
+		if trace is not None:
+			trace.record_arrival(len(path), 0, t.get_x(), t.get_y())
+		self.__emit("train_arrived", x=t.get_x(), y=t.get_y())
 		return True
+
+	def __draw_frame(self, train, renderer, viewport):
+		"""Draw the full map, or the viewport following the Train when a renderer is given"""
+		if renderer is None:
+			self.draw_map(train)
+		elif self.__sink.accepts("map_drawn"):
+			self.__emit("map_drawn", text=renderer.render_following(train, viewport[0], viewport[1]))
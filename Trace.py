@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+
+"""Classes to record simulation runs as compact binary traces and to replay them"""
+
+import sys
+import struct
+import bisect
+import argparse
+import Constants
+from SystemMap import SystemMap
+from MapRenderer import TileRenderer
+from SystemClasses import Train
+from EditJournal import object_to_spec, spec_to_object
+
+
+HEADER = struct.Struct("<4sHII")
+RECORD = struct.Struct(Constants.TRACE_RECORD)
+INDEX = struct.Struct("<IQ")
+TRAILER = struct.Struct("<QII4s")
+
+LAYOUT = 0
+TRAIN_MOVE = 1
+TRAIN_WAIT = 2
+TRAIN_ARRIVE = 3
+SIGNAL_CHANGE = 4
+JUNCTION_CHANGE = 5
+KEYFRAME = 6
+LAYOUT_CHANGE = 7
+
+KIND_NAMES = ["layout", "train_move", "train_wait", "train_arrive", "signal_change", "junction_change", "keyframe", "layout_change"]
+CELL_CODES = ["B", "E", "T", "S", "J"]
+EMPTY = 7
+DIRECTIONS = list(Constants.DIRECTION.keys())
+MOVES = dict((tuple(v), k) for k, v in Constants.DIRECTION.items())
+
+
+def encode_cell(obj):
+	"""Pack a TrackObject (or None) into a layout record value - its cell code with any state above"""
+	spec = object_to_spec(obj)
+	if spec is None:
+		return EMPTY
+	state = 0
+	if spec[0] == "S":
+		state = Constants.SIGNAL_STATES.index(spec[1])
+	elif spec[0] == "J":
+		state = DIRECTIONS.index(spec[1])
+	return CELL_CODES.index(spec[0]) | state << 3
+
+
+def decode_cell(value):
+	"""Unpack a layout record value into the spec of the TrackObject it describes, or None"""
+	if value == EMPTY:
+		return None
+	spec = [CELL_CODES[value & 7]]
+	if spec[0] == "S":
+		spec.append(Constants.SIGNAL_STATES[value >> 3])
+	elif spec[0] == "J":
+		spec.append(DIRECTIONS[value >> 3])
+	return spec
+
+
+class TraceWriter(object):
+	"""Writer recording a run on a SystemMap to a binary trace file
+
+	The writer also observes the map, so every cell placed, changed or removed during a run is
+	recorded at the tick given by the last set_tick() or record call.
+	"""
+	def __init__(self, path, system_map, keyframe_interval=Constants.TRACE_KEYFRAME_INTERVAL):
+		if keyframe_interval < 1:
+			raise ValueError("Keyframe interval must be at least 1 tick")
+		self.__file = open(path, "wb")
+		self.__map = system_map
+		self.__interval = keyframe_interval
+		self.__tick = 0
+		self.__next_keyframe = 0
+		self.__index = list()
+		self.__trains = dict()
+		self.__start = dict()
+
+		size = system_map.get_size()
+		self.__file.write(HEADER.pack(Constants.TRACE_MAGIC, Constants.TRACE_VERSION, size, keyframe_interval))
+		grid = system_map.get_map()
+		for x in range(size):
+			for y in range(size):
+				obj = grid[x][y]
+				if obj is None:
+					continue
+				value = self.__start[(x, y)] = encode_cell(obj)
+				self.__file.write(RECORD.pack(LAYOUT, 0, 0, x, y, value))
+		self.__cells = dict(self.__start)
+		self.__write_keyframe(0)
+		system_map.add_observer(self)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def get_tick(self):
+		return self.__tick
+
+	def set_tick(self, tick):
+		"""Set the tick used for signal and junction changes observed on the map"""
+		self.__tick = tick
+
+	def record_move(self, tick, train_id, x, y):
+		"""Record a train appearing at or moving into cell (x, y)"""
+		direction = 0
+		if train_id in self.__trains:
+			last = self.__trains[train_id]
+			direction = DIRECTIONS.index(MOVES.get((x - last[0], y - last[1]), DIRECTIONS[0]))
+		self.__write(TRAIN_MOVE, tick, train_id, x, y, direction)
+		self.__trains[train_id] = (x, y)
+
+	def record_wait(self, tick, train_id, x, y):
+		"""Record a train stopped at cell (x, y) waiting for a track action"""
+		self.__write(TRAIN_WAIT, tick, train_id, x, y, 0)
+
+	def record_arrival(self, tick, train_id, x, y):
+		"""Record a train reaching the end of its route at cell (x, y) and leaving the map"""
+		self.__write(TRAIN_ARRIVE, tick, train_id, x, y, 0)
+		self.__trains.pop(train_id, None)
+
+	def record_signal(self, tick, x, y, state):
+		"""Record the Signal at cell (x, y) changing to state"""
+		value = Constants.SIGNAL_STATES.index(state.upper())
+		self.__write(SIGNAL_CHANGE, tick, 0, x, y, value)
+		self.__cells[(x, y)] = CELL_CODES.index("S") | value << 3
+
+	def record_junction(self, tick, x, y, direction):
+		"""Record the Junction at cell (x, y) changing to direction"""
+		value = DIRECTIONS.index(direction.upper())
+		self.__write(JUNCTION_CHANGE, tick, 0, x, y, value)
+		self.__cells[(x, y)] = CELL_CODES.index("J") | value << 3
+
+	def cell_changed(self, x, y, old, new):
+		"""SystemMap observer hook - record the new contents of cell (x, y) at the current tick"""
+		value = encode_cell(new)
+		self.__write(LAYOUT_CHANGE, self.__tick, 0, x, y, value)
+		self.__cells[(x, y)] = value
+
+	def close(self):
+		"""Write the keyframe index and trailer, stop observing the map and close the file"""
+		if self.__file is None:
+			return
+		self.__map.remove_observer(self)
+		index_offset = self.__file.tell()
+		for tick, offset in self.__index:
+			self.__file.write(INDEX.pack(tick, offset))
+		self.__file.write(TRAILER.pack(index_offset, len(self.__index), self.__tick, Constants.TRACE_END))
+		self.__file.close()
+		self.__file = None
+
+	def __write(self, kind, tick, train_id, x, y, value):
+		"""Write one event record, writing a keyframe first when one is due"""
+		if tick < self.__tick:
+			raise ValueError("Trace records must be written in tick order - tick {} after {}".format(tick, self.__tick))
+		self.__tick = tick
+		if tick >= self.__next_keyframe:
+			self.__write_keyframe(tick)
+		self.__file.write(RECORD.pack(kind, tick, train_id, x, y, value))
+
+	def __write_keyframe(self, tick):
+		"""Write the trains and every cell differing from the starting layout as they stand before this tick's events"""
+		self.__index.append((tick, self.__file.tell()))
+		cells = [(pos, value) for pos, value in sorted(self.__cells.items()) if value != self.__start.get(pos, EMPTY)]
+		self.__file.write(RECORD.pack(KEYFRAME, tick, len(self.__trains) + len(cells), 0, 0, 0))
+		for train_id, (x, y) in sorted(self.__trains.items()):
+			self.__file.write(RECORD.pack(TRAIN_MOVE, tick, train_id, x, y, 0))
+		for (x, y), value in cells:
+			self.__file.write(RECORD.pack(LAYOUT_CHANGE, tick, 0, x, y, value))
+		self.__next_keyframe = tick + self.__interval
+
+
+class TraceReplay(object):
+	"""Reader seeking, rendering and analysing a binary trace without re-simulating the run"""
+	def __init__(self, path):
+		self.__file = open(path, "rb")
+		magic, version, size, interval = HEADER.unpack(self.__file.read(HEADER.size))
+		if magic != Constants.TRACE_MAGIC or version != Constants.TRACE_VERSION:
+			raise ValueError("File {} is not a version {} train trace".format(path, Constants.TRACE_VERSION))
+		self.__size = size
+		self.__interval = interval
+
+		self.__file.seek(-TRAILER.size, 2)
+		index_offset, count, last_tick, end = TRAILER.unpack(self.__file.read(TRAILER.size))
+		if end != Constants.TRACE_END:
+			raise ValueError("Trace file {} was not closed properly".format(path))
+		self.__end = index_offset
+		self.__last_tick = last_tick
+
+		self.__file.seek(index_offset)
+		data = self.__file.read(count * INDEX.size)
+		self.__key_ticks = list()
+		self.__key_offsets = list()
+		for tick, offset in INDEX.iter_unpack(data):
+			self.__key_ticks.append(tick)
+			self.__key_offsets.append(offset)
+
+		first = self.__key_offsets[0] if self.__key_offsets else self.__end
+		self.__file.seek(HEADER.size)
+		self.__layout = dict()
+		for kind, tick, train_id, x, y, value in RECORD.iter_unpack(self.__file.read(first - HEADER.size)):
+			self.__layout[(x, y)] = decode_cell(value)
+
+		self.__map = None
+		self.__renderer = None
+		self.__changed = set()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def close(self):
+		self.__file.close()
+
+	def get_size(self):
+		return self.__size
+
+	def get_last_tick(self):
+		return self.__last_tick
+
+	def get_keyframe_ticks(self):
+		return list(self.__key_ticks)
+
+	def records(self, start=0, stop=None):
+		"""Yield (kind, tick, train_id, x, y, value) event records with start <= tick <= stop
+
+		Reading begins at the last keyframe at or before start, so earlier parts of the run are
+		never read. Keyframe records themselves are not yielded.
+		"""
+		for record in self.__scan(start, stop, False):
+			yield record
+
+	def seek(self, tick):
+		"""Return the state at the end of a tick as a dictionary of trains and changed cells
+
+		Trains map train id to (x, y), and cells map each (x, y) differing from the starting
+		layout to the spec of its contents, or None when it was cleared.
+		"""
+		trains = dict()
+		cells = dict()
+		for kind, t, train_id, x, y, value in self.__scan(tick, tick, True):
+			if kind == KEYFRAME:
+				trains = dict()
+				cells = dict()
+			elif kind == TRAIN_MOVE:
+				trains[train_id] = (x, y)
+			elif kind == TRAIN_ARRIVE:
+				trains.pop(train_id, None)
+			elif kind == SIGNAL_CHANGE:
+				cells[(x, y)] = ["S", Constants.SIGNAL_STATES[value]]
+			elif kind == JUNCTION_CHANGE:
+				cells[(x, y)] = ["J", DIRECTIONS[value]]
+			elif kind == LAYOUT_CHANGE:
+				cells[(x, y)] = decode_cell(value)
+		return {"tick": tick, "trains": trains, "cells": cells}
+
+	def build_map(self, state=None):
+		"""Return the traced layout as a SystemMap, with the cells changed in a state rebuilt from their specs"""
+		if self.__map is None:
+			self.__map = SystemMap(self.__size)
+			for (x, y), spec in self.__layout.items():
+				self.__map.restore_cell(x, y, spec_to_object(x, y, spec))
+			self.__renderer = TileRenderer(self.__map)
+
+		if state is not None:
+			cells = dict((pos, self.__layout.get(pos)) for pos in self.__changed)
+			cells.update(state["cells"])
+			grid = self.__map.get_map()
+			for (x, y), spec in cells.items():
+				if object_to_spec(grid[x][y]) != spec:
+					self.__map.restore_cell(x, y, spec_to_object(x, y, spec))
+			self.__changed = set(state["cells"])
+		return self.__map
+
+	def render(self, tick, x=0, y=0, width=None, height=None):
+		"""Return the map text at the end of a tick for a viewport window, with trains drawn"""
+		state = self.seek(tick)
+		self.build_map(state)
+		width = self.__size if width is None else width
+		height = self.__size if height is None else height
+		trains = [Train(tx, ty, "UP", False) for tx, ty in state["trains"].values()]
+		return self.__renderer.render(x, y, width, height, trains)
+
+	def summary(self):
+		"""Return counts of every kind of event, trains seen and the traced tick range"""
+		counts = dict((name, 0) for name in KIND_NAMES if name not in ("layout", "keyframe"))
+		trains = set()
+		for kind, tick, train_id, x, y, value in self.__scan(0, None, False):
+			counts[KIND_NAMES[kind]] += 1
+			if kind in (TRAIN_MOVE, TRAIN_WAIT, TRAIN_ARRIVE):
+				trains.add(train_id)
+		counts["trains"] = len(trains)
+		counts["cells"] = len(self.__layout)
+		counts["keyframes"] = len(self.__key_ticks)
+		counts["last_tick"] = self.__last_tick
+		return counts
+
+	def __scan(self, start, stop, keyframes):
+		"""Yield records from the last keyframe at or before start up to tick stop
+
+		Keyframe records, and event records before start, are only yielded when keyframes is
+		True, as seek needs them to rebuild the state.
+		"""
+		if not self.__key_ticks:
+			return
+		k = max(0, bisect.bisect_right(self.__key_ticks, start) - 1)
+		offset = self.__key_offsets[k]
+		block = RECORD.size * Constants.TRACE_READ_RECORDS
+		in_keyframe = 0
+
+		while offset < self.__end:
+			self.__file.seek(offset)
+			data = self.__file.read(min(block, self.__end - offset))
+			offset += len(data)
+			for record in RECORD.iter_unpack(data):
+				kind, tick = record[0], record[1]
+				if stop is not None and tick > stop:
+					return
+				if kind == KEYFRAME:
+					in_keyframe = record[2]
+					if keyframes:
+						yield record
+					continue
+				if in_keyframe:
+					in_keyframe -= 1
+					if keyframes:
+						yield record
+				elif keyframes or tick >= start:
+					yield record
+
+
+def ParseViewport(text):
+	"""Parse an 'X,Y,W,H' viewport string into four integers"""
+	parts = [int(part.strip()) for part in text.split(",")]
+	if len(parts) != 4:
+		raise argparse.ArgumentTypeError("Viewport must be given as X,Y,W,H")
+	return parts
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Replay and analyse a Train Signal System trace file")
+	parser.add_argument("trace", help="Binary trace file to read")
+	parser.add_argument("--tick", type=int, help="Render the map at the end of this tick")
+	parser.add_argument("--view", type=ParseViewport, help="Viewport window X,Y,W,H to render")
+	args = parser.parse_args()
+
+	with TraceReplay(args.trace) as replay:
+		if args.tick is None:
+			for name, value in replay.summary().items():
+				print("{}: {}".format(name, value))
+		else:
+			view = args.view if args.view is not None else [0, 0, replay.get_size(), replay.get_size()]
+			print(replay.render(args.tick, view[0], view[1], view[2], view[3]))
@@ -13,6 +13,8 @@ import Constants
 import UserInputs as UI
 from SystemClasses import BeginningPoint, EndPoint, TrackSegment, Signal, Junction, Train
 from SystemMap import SystemMap
+from EventSink import ConsoleSink
+from JunctionOptimiser import JunctionOptimiser, apply_configuration
 
 
 def UserExit(signum, frame):
@@ -31,7 +33,7 @@ def TrainSignalSystem():
 	print("You will build a track and have a train run along it\n")
 	print("Begin by setting the grid size for the track map")
 	map_size = UI.GetMapSize()
-	sm = SystemMap(map_size)
+	sm = SystemMap(map_size, ConsoleSink())
 
 	input("System Map created - press any button to continue ... \n")
 	print("Build and run the simulation using the following commands\n")
@@ -116,11 +118,25 @@ def TrainSignalSystem():
 					print("Move #{} - {}".format(i+1, path[i]))
 				print("Do you want to view the Train travelling along path found?\n")
 				if UI.GetUserConfirmation():
-					sm.drive_train(path)
+					sm.drive_train(path, Constants.FRAME_DELAY)
 			else:
 				print("XXX Error, path could not be completed between BeginningPoint and EndPoint XXX")
 				print("Please review the system map layout and run the simaulation again\n")
 
+		elif cmd == "O":
+			print("~~~ Searching junction settings for the shortest route ~~~\n")
+			config = JunctionOptimiser(sm.snapshot()).optimise()
+			if config is not None:
+				print("!!! Shortest route found with {} moves !!!\n".format(config.get_cost()))
+				for junction, direction in sorted(config.get_junctions().items()):
+					print("Junction ({}, {}) - {}".format(junction[0], junction[1], direction))
+				print("\nDo you want to apply these junction settings to the map?\n")
+				if UI.GetUserConfirmation():
+					apply_configuration(sm, config)
+			else:
+				print("XXX Error, no junction settings complete a path between BeginningPoint and EndPoint XXX")
+				print("Please review the system map layout and run the optimiser again\n")
+
 		elif cmd == "H":
 			print(Constants.CMD_STR)
 